@@ -1,4 +1,6 @@
+import errno
 import os
+import re
 import shutil
 import sys
 import hashlib
@@ -6,106 +8,218 @@ import argparse
 import zipfile
 from urllib.parse import quote
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+LINK_RE = re.compile(r"<a [^>]*>.*?</a>")
+
+ROOT_INDEX_TEMPLATE = b'<!DOCTYPE html>\n<html><head><title>Simple Index</title><meta name="api-version" value="2" /></head><body>\n%b\n</body></html>'
+PACKAGE_INDEX_TEMPLATE = b"\n".join([
+    b'<!DOCTYPE html>',
+    b'<html>',
+    b'    <head>',
+    b'        <title>Simple Index</title>',
+    b'        <meta name="api-version" value="2"/>',
+    b'    </head>',
+    b'    <body>',
+    b'%b',
+    b'    </body>',
+    b'</html>'
+])
+
 
 def calculate_sha256(file_path):
     """Calculate the SHA-256 hash of a file."""
-    sha256 = hashlib.sha256()
     with open(file_path, 'rb') as f:
-        while chunk := f.read(8192):
+        if hasattr(hashlib, "file_digest"):  # Python 3.11+
+            return hashlib.file_digest(f, "sha256").hexdigest()
+        sha256 = hashlib.sha256()
+        buf = memoryview(bytearray(1 << 20))
+        while n := f.readinto(buf):
+            sha256.update(buf[:n])
+    return sha256.hexdigest()
+
+
+def copy_and_calculate_sha256(src_path, dest_path):
+    """Copy a file like shutil.copy2 and calculate its SHA-256 hash in the same pass."""
+    if os.path.exists(dest_path) and os.path.samefile(src_path, dest_path):
+        raise shutil.SameFileError(f"{src_path!r} and {dest_path!r} are the same file")
+
+    sha256 = hashlib.sha256()
+    # One buffer is reused for every chunk instead of allocating a new bytes object per read
+    buf = memoryview(bytearray(1 << 20))
+    with open(src_path, 'rb') as src, open(dest_path, 'wb') as dest:
+        while n := src.readinto(buf):
+            chunk = buf[:n]
+            dest.write(chunk)
             sha256.update(chunk)
+    shutil.copystat(src_path, dest_path)
     return sha256.hexdigest()
 
 
+def link_and_calculate_sha256(src_path, dest_path):
+    """Hardlink a file into place and calculate its SHA-256 hash.
+
+    Falls back to copy_and_calculate_sha256 when the filesystem cannot link the
+    file, e.g. when the destination is on a different filesystem.
+    """
+    if os.path.exists(dest_path) and os.path.samefile(src_path, dest_path):
+        return calculate_sha256(src_path)
+
+    tmp_path = f"{dest_path}.{os.urandom(8).hex()}.tmp"
+    try:
+        os.link(src_path, tmp_path)
+    except OSError as e:
+        # Windows reports a volume without hardlink support (e.g. FAT32) as
+        # ERROR_INVALID_FUNCTION or ERROR_NOT_SUPPORTED, which map to EINVAL
+        cannot_link = (e.errno in (errno.EXDEV, errno.EPERM, errno.ENOTSUP, errno.EMLINK)
+                       or getattr(e, "winerror", None) in (1, 50))
+        if not cannot_link:
+            raise
+        return copy_and_calculate_sha256(src_path, dest_path)
+    try:
+        os.replace(tmp_path, dest_path)
+    finally:
+        if os.path.lexists(tmp_path):
+            os.remove(tmp_path)
+    return calculate_sha256(src_path)
+
+
 def extract_requires_python(whl_file):
     """Extract the Python requirement from the wheel file metadata."""
     try:
+        name, version = os.path.basename(whl_file).split("-")[:2]
         with zipfile.ZipFile(whl_file, 'r') as z:
-            for name in z.namelist():
-                if name.endswith(".dist-info/METADATA"):
-                    with z.open(name) as meta_file:
-                        for line in meta_file:
-                            decoded_line = line.decode("utf-8").strip()
-                            if decoded_line.startswith("Requires-Python:"):
-                                return decoded_line.split(":", 1)[1].strip()
+            try:
+                meta_info = z.getinfo(f"{name}-{version}.dist-info/METADATA")
+            except KeyError:
+                # The .dist-info directory name does not match the wheel filename
+                meta_info = next((info for info in z.infolist() if info.filename.endswith(".dist-info/METADATA")), None)
+            if meta_info is not None:
+                with z.open(meta_info) as meta_file:
+                    # No early stop at blank lines: older wheels put blank lines inside License/Description headers
+                    for line in meta_file:
+                        if line.startswith(b"Requires-Python:"):
+                            return line.split(b":", 1)[1].strip().decode("utf-8")
     except Exception as e:
         print(f"Warning: Could not extract 'Requires-Python' from {whl_file}: {e}")
     return None
 
 
+def open_or_create(index_file):
+    """Open a file for reading and writing, creating it if it does not exist.
+
+    The file is exclusively locked where fcntl is available, so concurrent runs
+    updating the same index wait for each other. Returns the binary file object
+    and whether the file is new (empty).
+    """
+    # O_BINARY keeps the Windows CRT from translating newlines under the offsets used for splicing
+    flags = os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0)
+    f = os.fdopen(os.open(index_file, flags, 0o666), "r+b")
+    if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_EX)
+    return f, os.fstat(f.fileno()).st_size == 0
+
+
+def insert_before_body_end(f, link_entry):
+    """Insert an encoded line before the closing </body> tag, rewriting only the tail of the file.
+
+    Returns False, leaving the file untouched, if it has no </body> tag.
+    """
+    size = f.seek(0, os.SEEK_END)
+    tail_size = 1024
+    while True:
+        offset = max(0, size - tail_size)
+        f.seek(offset)
+        tail = f.read()
+        body_end = tail.rfind(b"</body>")
+        line_start = tail.rfind(b"\n", 0, body_end) + 1
+        # Keep reading backwards until the whole </body> line is in the tail
+        if offset == 0 or (body_end != -1 and line_start > 0):
+            break
+        tail_size *= 2
+
+    if body_end == -1:
+        return False
+    if tail[line_start:body_end].strip():
+        # </body> shares its line with other markup, insert right before the tag
+        line_start = body_end
+
+    f.seek(offset + line_start)
+    f.write(link_entry + b"\n" + tail[line_start:])
+    return True
+
+
+def load_index_entries(entries_file, index_f):
+    """Load the set of links in an index file from its entries_file sidecar.
+
+    If the sidecar does not exist yet it is seeded from the links found in index_f.
+    """
+    if os.path.exists(entries_file):
+        with open(entries_file, "r", encoding="utf-8") as f:
+            return set(f.read().splitlines())
+
+    index_f.seek(0)
+    entries = set(LINK_RE.findall(index_f.read().decode("utf-8")))
+    with open(entries_file, "w", encoding="utf-8") as f:
+        f.writelines(f"{entry}\n" for entry in sorted(entries))
+    return entries
+
+
 def update_root_index(pkg_name, root_dir):
     """Update the root index.html file with a link to the package."""
     index_file = os.path.join(root_dir, "index.html")
+    entries_file = os.path.join(root_dir, ".entries")
     link_entry = f'<a href="{pkg_name}" rel="internal">{pkg_name}</a>'
 
-    if os.path.exists(index_file):
-        with open(index_file, "r", encoding="utf-8") as f:
-            content = f.read()
-        if link_entry not in content:
-            content = content.replace("</body>", f"{link_entry}\n</body>")
-    else:
-        content = f'<!DOCTYPE html>\n<html><head><title>Simple Index</title><meta name="api-version" value="2" /></head><body>\n{link_entry}\n</body></html>'
+    f, is_new = open_or_create(index_file)
+    with f:
+        if is_new:
+            f.write(ROOT_INDEX_TEMPLATE % link_entry.encode("utf-8"))
+            with open(entries_file, "w", encoding="utf-8") as entries_f:
+                entries_f.write(f"{link_entry}\n")
+            return
 
-    with open(index_file, "w", encoding="utf-8") as f:
-        f.write(content)
+        if link_entry in load_index_entries(entries_file, f):
+            return
 
+        if not insert_before_body_end(f, link_entry.encode("utf-8")):
+            print(f"Warning: No </body> tag in {index_file}, could not add a link to {pkg_name}")
+            return
+        with open(entries_file, "a", encoding="utf-8") as entries_f:
+            entries_f.write(f"{link_entry}\n")
 
-def update_package_index(pkg_name, version, whl_file, root_dir, base_url):
+
+def update_package_index(pkg_name, version, whl_file, sha256_hash, requires_python, root_dir, base_url):
     """Update the index.html file in the package directory with the new .whl file."""
     package_dir = os.path.join(root_dir, pkg_name)
     index_file = os.path.join(package_dir, "index.html")
-    sha256_hash = calculate_sha256(whl_file)
     whl_filename = os.path.basename(whl_file)
     whl_url = f"{base_url}/{pkg_name}/{version}/{quote(whl_filename)}#sha256={sha256_hash}"
-    requires_python = extract_requires_python(whl_file)
     requires_python_attr = f' data-requires-python="{requires_python.replace("<", "&lt;").replace(">", "&gt;")}"' if requires_python else ""
-    link_entry = f'        <a href="{whl_url}"{requires_python_attr} rel="internal">{whl_filename}</a>'
-
-    if os.path.exists(index_file):
-        with open(index_file, "r", encoding="utf-8") as f:
-            content = f.readlines()
-
-        # Ensure all links remain within the <body> tag
-        cleaned_content = []
-        inside_body = False
-        for line in content:
-            stripped_line = line.strip()
-            if stripped_line == "<body>":
-                inside_body = True
-            cleaned_content.append(line.rstrip())
-            if stripped_line == "</body>" and inside_body:
-                cleaned_content.insert(-1, link_entry)  # Insert before </body>
-                inside_body = False
-
-        content = cleaned_content
-    else:
-        content = [
-            '<!DOCTYPE html>',
-            '<html>',
-            '    <head>',
-            '        <title>Simple Index</title>',
-            '        <meta name="api-version" value="2"/>',
-            '    </head>',
-            '    <body>',
-            f'{link_entry}',
-            '    </body>',
-            '</html>'
-        ]
-
-    with open(index_file, "w", encoding="utf-8") as f:
-        f.write("\n".join(content))
-
-
-def process_whl_file(whl_file, root_dir, base_url):
-    """Process a .whl file and update the directory structure and index.html files."""
+    link_entry = f'        <a href="{whl_url}"{requires_python_attr} rel="internal">{whl_filename}</a>'.encode("utf-8")
+
+    f, is_new = open_or_create(index_file)
+    with f:
+        if is_new:
+            f.write(PACKAGE_INDEX_TEMPLATE % link_entry)
+        elif not insert_before_body_end(f, link_entry):
+            print(f"Warning: No </body> tag in {index_file}, could not add a link to {whl_filename}")
+
+
+def ingest_whl_file(whl_file, root_dir, link_mode="copy"):
+    """Copy or link a .whl file into the directory structure and collect the data its index entry needs."""
     if not os.path.exists(whl_file):
         print(f"Error: File {whl_file} does not exist.")
-        return
+        return None
 
     whl_filename = os.path.basename(whl_file)
     parts = whl_filename.split("-")
     if len(parts) < 2:
         print(f"Error: Invalid .whl filename format: {whl_filename}")
-        return
+        return None
 
     pkg_name = parts[0]
     version = parts[1]
@@ -114,22 +228,94 @@ def process_whl_file(whl_file, root_dir, base_url):
     os.makedirs(pkg_version_dir, exist_ok=True)
 
     dest_whl_path = os.path.join(pkg_version_dir, whl_filename)
-    shutil.copy2(whl_file, dest_whl_path)
+    if link_mode == "hardlink":
+        sha256_hash = link_and_calculate_sha256(whl_file, dest_whl_path)
+    else:
+        sha256_hash = copy_and_calculate_sha256(whl_file, dest_whl_path)
+
+    return pkg_name, version, dest_whl_path, sha256_hash, extract_requires_python(dest_whl_path)
+
 
+def index_whl_file(whl_entry, root_dir, base_url):
+    """Add an ingested .whl file to the root and package index.html files."""
+    pkg_name, version, whl_file, sha256_hash, requires_python = whl_entry
     update_root_index(pkg_name, root_dir)
-    update_package_index(pkg_name, version, dest_whl_path, root_dir, base_url)
+    update_package_index(pkg_name, version, whl_file, sha256_hash, requires_python, root_dir, base_url)
+
+
+def process_whl_file(whl_file, root_dir, base_url, link_mode="copy"):
+    """Process a .whl file and update the directory structure and index.html files."""
+    whl_entry = ingest_whl_file(whl_file, root_dir, link_mode)
+    if whl_entry is None:
+        return
+
+    index_whl_file(whl_entry, root_dir, base_url)
     print(f"Successfully processed {whl_file} and updated index files.")
 
 
+def process_many(whl_files, root_dir, base_url, link_mode="copy", jobs=None):
+    """Process several .whl files, copying and hashing them concurrently.
+
+    hashlib releases the GIL while hashing, so the per-wheel work scales across
+    up to `jobs` threads (default: one per CPU). The index.html files are then
+    updated one wheel at a time.
+    """
+    # Imported here so that single-wheel runs do not pay for concurrent.futures (and logging)
+    from concurrent.futures import ThreadPoolExecutor
+
+    def ingest(whl_file):
+        try:
+            return ingest_whl_file(whl_file, root_dir, link_mode)
+        except OSError as e:  # Includes shutil.SameFileError
+            print(f"Error: Could not process {whl_file}: {e}")
+            return None
+
+    # The destination only depends on the file name, so inputs sharing one would write to the same path
+    unique_whl_files = {}
+    for whl_file in whl_files:
+        whl_filename = os.path.basename(whl_file)
+        if whl_filename in unique_whl_files:
+            print(f"Error: Skipping {whl_file}, {unique_whl_files[whl_filename]} has the same file name.")
+            continue
+        unique_whl_files[whl_filename] = whl_file
+    whl_files = list(unique_whl_files.values())
+
+    with ThreadPoolExecutor(max_workers=os.cpu_count() if jobs is None else jobs) as executor:
+        whl_entries = list(executor.map(ingest, whl_files))
+
+    for whl_file, whl_entry in zip(whl_files, whl_entries):
+        if whl_entry is None:
+            continue
+        index_whl_file(whl_entry, root_dir, base_url)
+        print(f"Successfully processed {whl_file} and updated index files.")
+
+
+def positive_int(value):
+    """argparse type for options that take an integer of at least 1."""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: {value!r}")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Process a .whl file and update the directory structure and index.html files.")
-    parser.add_argument("--whl_file", help="Path to the .whl file")
+    parser.add_argument("--whl_file", nargs="+", help="Path to the .whl file(s)")
     parser.add_argument("--root_dir", default=".", help="Root directory for storing package files")
     parser.add_argument("--base_url", help="Base URL for the package repository")
+    parser.add_argument("--link_mode", choices=["copy", "hardlink"], default="copy",
+                        help="How to place the .whl file in the root directory (hardlink falls back to copy)")
+    parser.add_argument("--jobs", type=positive_int, help="Number of .whl files to process concurrently (default: CPU count)")
 
     args = parser.parse_args()
-    process_whl_file(args.whl_file, args.root_dir, args.base_url)
+    if len(args.whl_file) == 1:
+        process_whl_file(args.whl_file[0], args.root_dir, args.base_url, args.link_mode)
+    else:
+        process_many(args.whl_file, args.root_dir, args.base_url, args.link_mode, args.jobs)
 
 
 if __name__ == "__main__":